@@ -1,194 +1,446 @@
 import streamlit as st
 import pandas as pd
+import openpyxl
 import os
+import re
+import zipfile
 from datetime import datetime, date
 from io import BytesIO
 from reportlab.lib.pagesizes import letter
+from reportlab.lib.units import inch
 from reportlab.pdfgen import canvas
 from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import SimpleDocTemplate, LongTable, TableStyle, Paragraph, Spacer
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.enums import TA_CENTER
+from xml.sax.saxutils import escape
 
 # File path
 EXCEL_FILE = "farm_data.xlsx"
 
-# Initialize file with proper schema (removed Category from Classification)
-if not os.path.exists(EXCEL_FILE):
-    with pd.ExcelWriter(EXCEL_FILE, engine="openpyxl") as writer:
-        pd.DataFrame(columns=["Tag", "Amount", "Date"]).to_excel(writer, sheet_name="Revenue", index=False)
-        pd.DataFrame(columns=["Tag", "Amount", "Date"]).to_excel(writer, sheet_name="Expenditure", index=False)
-        pd.DataFrame(columns=["Name", "Gender", "Breed", "New Borns",
-                              "Weight", "Dead Count", "Vaccination Date", "Details", "Date"]).to_excel(writer, sheet_name="Classification", index=False)
+# "Date" columns are stored as text in this format and held as datetime64 once loaded
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Hidden column holding Date cells that aren't in DATE_FORMAT exactly as they were read, so saving writes them back unchanged
+RAW_DATE = "Date (as read)"
+
+# What Excel leaves in a sheet's XML and a values-only rewrite would lose: formulas, column widths,
+# merged cells, data validation, conditional formats (possibly namespace-prefixed) and cells or rows
+# with a style other than the default s="0"
+EXCEL_EDIT_MARKERS = re.compile(
+    rb"<(?:\w+:)?(?:f|cols|mergeCells|dataValidations|conditionalFormatting)[\s>/]|\ss=\"(?!0\")"
+)
+
+# Whole numbers in these columns would load as int64, which rejects a fractional value typed into an edit form
+FLOAT_COLUMNS = ["Amount", "Weight"]
+
+# Reading with calamine (Rust) skips openpyxl's XML DOM; fall back when it isn't installed
+try:
+    import python_calamine  # noqa: F401
+    READ_ENGINE = "calamine"
+except ImportError:
+    READ_ENGINE = "openpyxl"
+
+# Sheet schema (removed Category from Classification)
+SHEET_COLUMNS = {
+    "Revenue": ["Tag", "Amount", "Date"],
+    "Expenditure": ["Tag", "Amount", "Date"],
+    "Classification": ["Name", "Gender", "Breed", "New Borns",
+                       "Weight", "Dead Count", "Vaccination Date", "Details", "Date"],
+}
+
+
+@st.cache_resource(show_spinner=False)
+def _ensure_schema():
+    """Initialize file with proper schema; runs once per Streamlit process, not on every rerun"""
+    if not os.path.exists(EXCEL_FILE):
+        wb = openpyxl.Workbook(write_only=True)
+        for name, columns in SHEET_COLUMNS.items():
+            wb.create_sheet(name).append(columns)
+        wb.save(EXCEL_FILE)
+
+
+_ensure_schema()
+
+
+# Opened once per file version and kept open until the file changes
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _workbook(mtime):
+    """openpyxl workbook in read-only mode, which doesn't build the cell DOM"""
+    return openpyxl.load_workbook(EXCEL_FILE, read_only=True, data_only=True)
+
+
+def _sheet_names(mtime):
+    if READ_ENGINE == "calamine":
+        with pd.ExcelFile(EXCEL_FILE, engine="calamine") as xlsx:
+            return xlsx.sheet_names
+    return _workbook(mtime).sheetnames
+
+
+def _read_sheet_openpyxl(sheet_name, mtime, usecols=None):
+    # One pass over the rows; per-cell ws.cell() lookups are what make openpyxl slow
+    rows = _workbook(mtime)[sheet_name].iter_rows(values_only=True)
+    header = next(rows, ())
+    if usecols is not None:
+        positions = [header.index(col) for col in usecols]
+        header = usecols
+        rows = ([row[i] for i in positions] for row in rows)
+    return pd.DataFrame(rows, columns=header).dropna(how="all").reset_index(drop=True)
+
+
+def _parse_dates(raw):
+    """Parse a Date column; cells typed in Excel may use another format, so those get a second, lenient pass.
+    
+    Dates that still can't be read become NaT; the sections flag them with warn_unreadable_dates.
+    """
+    dates = pd.to_datetime(raw, format=DATE_FORMAT, errors="coerce", cache=True)
+    retry = dates.isna() & raw.notna()
+    if retry.any():
+        dates[retry] = pd.to_datetime(raw[retry], format="mixed", errors="coerce")
+    return dates
+
+
+# A few file versions' worth of sheets; older versions are never asked for again once the file changes
+@st.cache_data(show_spinner=False, max_entries=8)
+def _load_sheet(sheet_name, mtime, usecols=None):
+    if READ_ENGINE == "calamine":
+        # A calamine handle must not be shared between session threads, so each cache miss opens its own
+        with pd.ExcelFile(EXCEL_FILE, engine="calamine") as xlsx:
+            df = xlsx.parse(sheet_name, usecols=usecols)
+    else:
+        df = _read_sheet_openpyxl(sheet_name, mtime, usecols)
+    for col in FLOAT_COLUMNS:
+        if col in df and pd.api.types.is_integer_dtype(df[col]):
+            df[col] = df[col].astype(float)
+    # Parsed once here so date filters never have to re-parse the text
+    if "Date" in df:
+        raw = df["Date"]
+        df["Date"] = _parse_dates(raw)
+        df[RAW_DATE] = raw.where(df["Date"].dt.strftime(DATE_FORMAT).astype(object) != raw.astype(object))
+    return df
 
 
 def load_data(sheet_name):
-    return pd.read_excel(EXCEL_FILE, sheet_name=sheet_name)
+    # The file's mtime is part of the cache key, so save_sheets invalidates it
+    return _load_sheet(sheet_name, os.path.getmtime(EXCEL_FILE))
 
 
-def save_data(df, sheet_name):
-    with pd.ExcelWriter(EXCEL_FILE, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
-        df.to_excel(writer, sheet_name=sheet_name, index=False)
+def _load_columns(sheet_name, mtime, cols):
+    # calamine parses the whole sheet even with usecols, so slice the cached full frame instead
+    if READ_ENGINE == "calamine":
+        return _load_sheet(sheet_name, mtime)[cols]
+    return _load_sheet(sheet_name, mtime, cols)
 
 
-def add_record(sheet_name, record):
+def _has_excel_edits():
+    """True if any sheet holds formulas or formatting, i.e. the file was edited in Excel"""
+    with zipfile.ZipFile(EXCEL_FILE) as zf:
+        return any(
+            EXCEL_EDIT_MARKERS.search(zf.read(name))
+            for name in zf.namelist() if name.startswith("xl/worksheets/") and name.endswith(".xml")
+        )
+
+
+def _as_stored(df):
+    """Frame as it is written to the workbook, with Date back in its text format"""
+    if "Date" in df:
+        stored = df["Date"].dt.strftime(DATE_FORMAT).astype(object).where(df[RAW_DATE].isna(), df[RAW_DATE])
+        df = df.assign(Date=stored).drop(columns=RAW_DATE)
+    return df
+
+
+def save_sheets(frames):
+    """Replace the given sheets in the workbook.
+    
+    The fast path streams every sheet into a fresh write-only workbook, which keeps values only.
+    If the file carries formulas or formatting from Excel, only the changed sheets are replaced
+    and the rest of the workbook is left as it was.
+    """
+    if _has_excel_edits():
+        with pd.ExcelWriter(EXCEL_FILE, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
+            for name, sheet_df in frames.items():
+                _as_stored(sheet_df).to_excel(writer, sheet_name=name, index=False)
+        return
+    
+    sheets = {name: load_data(name) for name in _sheet_names(os.path.getmtime(EXCEL_FILE))}
+    sheets.update(frames)
+
+    wb = openpyxl.Workbook(write_only=True)
+    for name, sheet_df in sheets.items():
+        ws = wb.create_sheet(name)
+        sheet_df = _as_stored(sheet_df)
+        ws.append(list(sheet_df.columns))
+        # Blank cells for missing values, as to_excel writes them
+        for row in sheet_df.astype(object).where(sheet_df.notna(), None).itertuples(index=False, name=None):
+            ws.append(row)
+    wb.save(EXCEL_FILE)
+
+
+# Unsaved changes are kept per sheet as a list of operations in st.session_state.pending:
+# ("add", record), ("edit", original_row, updated_record) or ("delete", original_row).
+# They are replayed on the current workbook, so records saved meanwhile by other sessions are kept.
+
+def _find_row(df, row):
+    """Position of the first row holding exactly the values in row, or None"""
+    matches = pd.Series(True, index=df.index)
+    for col, value in row.items():
+        if col in df:
+            matches &= df[col].isna() if pd.isna(value) else df[col].eq(value)
+    positions = matches.to_numpy().nonzero()[0]
+    return positions[0] if len(positions) else None
+
+
+def _apply_ops(df, ops):
+    """Replay changes on a sheet; also returns how many no longer apply because their record is gone"""
+    skipped = 0
+    for op, *args in ops:
+        if op == "add":
+            # load_data hands back a copy of the cached sheet, so the row is appended in place
+            df.loc[len(df)] = args[0]
+            continue
+        position = _find_row(df, args[0])
+        if position is None:
+            skipped += 1
+        elif op == "edit":
+            # Only the edited fields, so the row keeps its RAW_DATE
+            df.loc[position, list(args[1])] = list(args[1].values())
+        else:
+            df = df.drop(position).reset_index(drop=True)
+    return df, skipped
+
+
+def get_data(sheet_name):
+    """Sheet as this session sees it, including changes not yet saved"""
     df = load_data(sheet_name)
-    df = pd.concat([df, pd.DataFrame([record])], ignore_index=True)
-    save_data(df, sheet_name)
+    if sheet_name in st.session_state.pending:
+        df, _ = _apply_ops(df, st.session_state.pending[sheet_name])
+    return df
+
+
+def save_pending():
+    """Replay this session's changes on the workbook as it is now and write them in a single save.
+    
+    Returns how many changes were dropped because another session had already edited or deleted their record.
+    """
+    frames, skipped = {}, 0
+    for sheet_name, ops in st.session_state.pending.items():
+        frames[sheet_name], sheet_skipped = _apply_ops(load_data(sheet_name), ops)
+        skipped += sheet_skipped
+    if frames:
+        save_sheets(frames)
+    st.session_state.pending = {}
+    return skipped
+
+
+# Mutations are only recorded; save_pending writes them out
+def add_record(sheet_name, record):
+    st.session_state.pending.setdefault(sheet_name, []).append(("add", record))
 
 
 def delete_record(sheet_name, index):
-    df = load_data(sheet_name)
-    df = df.drop(index).reset_index(drop=True)
-    save_data(df, sheet_name)
+    row = get_data(sheet_name).iloc[index].to_dict()
+    st.session_state.pending.setdefault(sheet_name, []).append(("delete", row))
 
 
 def edit_record(sheet_name, index, updated_record):
-    df = load_data(sheet_name)
-    df.loc[index] = updated_record
-    save_data(df, sheet_name)
+    df = get_data(sheet_name)
+    edit = ("edit", df.iloc[index].to_dict(), updated_record)
+    # Applied once here so an edit the sheet can't hold raises now instead of on every later rerun
+    _apply_ops(df, [edit])
+    st.session_state.pending.setdefault(sheet_name, []).append(edit)
+
+
+@st.cache_data(show_spinner=False, max_entries=2)
+def _totals(mtime):
+    """Revenue and expenditure totals for one version of the workbook"""
+    df_revenue = _load_columns("Revenue", mtime, ["Amount"])
+    df_expenditure = _load_columns("Expenditure", mtime, ["Amount"])
+    
+    total_revenue = df_revenue["Amount"].sum() if not df_revenue.empty else 0
+    total_expenditure = df_expenditure["Amount"].sum() if not df_expenditure.empty else 0
+    
+    return total_revenue, total_expenditure
 
 
 def calculate_profit_loss():
     """Calculate total profit or loss"""
     try:
-        df_revenue = load_data("Revenue")
-        df_expenditure = load_data("Expenditure")
+        total_revenue, total_expenditure = _totals(os.path.getmtime(EXCEL_FILE))
         
-        total_revenue = df_revenue["Amount"].sum() if not df_revenue.empty else 0
-        total_expenditure = df_expenditure["Amount"].sum() if not df_expenditure.empty else 0
+        # Unsaved changes are reflected straight away
+        for sheet_name in st.session_state.pending.keys() & {"Revenue", "Expenditure"}:
+            df = get_data(sheet_name)
+            total = df["Amount"].sum() if not df.empty else 0
+            if sheet_name == "Revenue":
+                total_revenue = total
+            else:
+                total_expenditure = total
         
         return total_revenue - total_expenditure, total_revenue, total_expenditure
     except:
         return 0, 0, 0
 
 
+def warn_unreadable_dates(sheet_name, df):
+    unreadable = int(df["Date"].isna().sum())
+    if unreadable:
+        st.warning(f"{sheet_name}: {unreadable} record(s) have a Date that can't be read. "
+                   "They are left out of reports but saved unchanged.")
+
+
 def filter_data_by_date(df, start_date, end_date):
     """Filter dataframe by date range"""
     if df.empty:
         return df
     
-    df['Date_parsed'] = pd.to_datetime(df['Date'], format='%Y-%m-%d %H:%M:%S').dt.date
-    filtered_df = df[(df['Date_parsed'] >= start_date) & (df['Date_parsed'] <= end_date)]
-    return filtered_df.drop('Date_parsed', axis=1)
+    # Compare against datetime64 bounds instead of building a date object per row
+    start = pd.Timestamp(start_date)
+    end = pd.Timestamp(end_date) + pd.Timedelta(days=1)
+    return df.loc[(df['Date'] >= start) & (df['Date'] < end)]
+
+
+# Built once rather than on every report
+STYLES = getSampleStyleSheet()
+
+# Amount cells in the reports; the ₹ sign is in the column header
+FORMAT_AMOUNT = "{:,.2f}".format
+
+# Shared by every report table; the classification header is smaller to fit seven columns
+TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 14),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+])
+CLASSIFICATION_TABLE_STYLE = TableStyle([
+    ('FONTSIZE', (0, 0), (-1, 0), 12),
+], parent=TABLE_STYLE)
+
+# Free-text cells (Name/Tag, Breed) and the classification headers are Paragraphs so they wrap inside their columns
+CLASSIFICATION_HEADER_STYLE = ParagraphStyle('ClassificationHeader', parent=STYLES['Normal'], fontName='Helvetica-Bold',
+                                             fontSize=12, leading=14, textColor=colors.whitesmoke, alignment=TA_CENTER)
+WRAPPED_CELL_STYLE = ParagraphStyle('WrappedCell', parent=STYLES['Normal'], alignment=TA_CENTER)
+
+# Fixed column widths let LongTable lay out rows without measuring every cell
+AMOUNT_COL_WIDTHS = [2.5 * inch, 1.5 * inch, 2 * inch]
+CLASSIFICATION_HEADER = ['Name', 'Gender', 'Breed', 'Weight (kg)', 'New Borns', 'Dead Count', 'Vaccination Date']
+# The short columns are as wide as their longest header word; Name and Breed share what is left of the frame
+CLASSIFICATION_FREE_COLUMNS = ('Name', 'Breed')
+CLASSIFICATION_FIXED_WIDTHS = {
+    h: max(stringWidth(word, 'Helvetica-Bold', 12) for word in h.split()) + 12
+    for h in CLASSIFICATION_HEADER if h not in CLASSIFICATION_FREE_COLUMNS
+}
+
+
+def classification_col_widths(frame_width):
+    free_width = (frame_width - sum(CLASSIFICATION_FIXED_WIDTHS.values())) / len(CLASSIFICATION_FREE_COLUMNS)
+    return [CLASSIFICATION_FIXED_WIDTHS.get(h, free_width) for h in CLASSIFICATION_HEADER]
+
+
+def wrapped_cells(values):
+    """Paragraph per value, so long free text wraps instead of spilling into the next column"""
+    return [Paragraph(escape(str(v)), WRAPPED_CELL_STYLE) for v in values.fillna("")]
 
 
 def create_pdf_report(report_type, start_date, end_date):
     """Generate PDF report with proper formatting"""
     buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    styles = getSampleStyleSheet()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, pageCompression=1)
     story = []
     
     # Title
-    title = Paragraph(f"Farm Report - {report_type}", styles['Title'])
+    title = Paragraph(f"Farm Report - {report_type}", STYLES['Title'])
     story.append(title)
     story.append(Spacer(1, 20))
     
     # Date range
-    date_range = Paragraph(f"Period: {start_date} to {end_date}", styles['Normal'])
+    date_range = Paragraph(f"Period: {start_date} to {end_date}", STYLES['Normal'])
     story.append(date_range)
     story.append(Spacer(1, 20))
     
     # Summary
     profit_loss, total_revenue, total_expenditure = calculate_profit_loss()
-    summary = Paragraph(f"<b>Financial Summary:</b><br/>Total Revenue: ₹{total_revenue:,.2f}<br/>Total Expenditure: ₹{total_expenditure:,.2f}<br/>Profit/Loss: ₹{profit_loss:,.2f}", styles['Normal'])
+    summary = Paragraph(f"<b>Financial Summary:</b><br/>Total Revenue: ₹{total_revenue:,.2f}<br/>Total Expenditure: ₹{total_expenditure:,.2f}<br/>Profit/Loss: ₹{profit_loss:,.2f}", STYLES['Normal'])
     story.append(summary)
     story.append(Spacer(1, 30))
     
     if report_type in ["Revenue", "All"]:
         # Revenue section
-        revenue_title = Paragraph("Revenue Records", styles['Heading2'])
+        revenue_title = Paragraph("Revenue Records", STYLES['Heading2'])
         story.append(revenue_title)
         story.append(Spacer(1, 10))
         
-        df_revenue = load_data("Revenue")
+        df_revenue = get_data("Revenue")
         filtered_revenue = filter_data_by_date(df_revenue, start_date, end_date)
         
         if not filtered_revenue.empty:
-            revenue_data = [['Name', 'Amount (₹)', 'Date']]
-            for _, row in filtered_revenue.iterrows():
-                revenue_data.append([row['Tag'], f"{row['Amount']:,.2f}", row['Date']])
+            amounts = filtered_revenue['Amount'].map(FORMAT_AMOUNT).tolist()
+            revenue_data = [['Name', 'Amount (₹)', 'Date']] + list(map(list, zip(
+                wrapped_cells(filtered_revenue['Tag']), amounts, filtered_revenue['Date'].dt.strftime(DATE_FORMAT).to_numpy()
+            )))
             
-            revenue_table = Table(revenue_data)
-            revenue_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 14),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
+            revenue_table = LongTable(revenue_data, colWidths=AMOUNT_COL_WIDTHS, repeatRows=1)
+            revenue_table.setStyle(TABLE_STYLE)
             story.append(revenue_table)
             story.append(Spacer(1, 20))
         else:
-            story.append(Paragraph("No revenue records found for this period.", styles['Normal']))
+            story.append(Paragraph("No revenue records found for this period.", STYLES['Normal']))
             story.append(Spacer(1, 20))
     
     if report_type in ["Expenditure", "All"]:
         # Expenditure section
-        expenditure_title = Paragraph("Expenditure Records", styles['Heading2'])
+        expenditure_title = Paragraph("Expenditure Records", STYLES['Heading2'])
         story.append(expenditure_title)
         story.append(Spacer(1, 10))
         
-        df_expenditure = load_data("Expenditure")
+        df_expenditure = get_data("Expenditure")
         filtered_expenditure = filter_data_by_date(df_expenditure, start_date, end_date)
         
         if not filtered_expenditure.empty:
-            expenditure_data = [['Name', 'Amount (₹)', 'Date']]
-            for _, row in filtered_expenditure.iterrows():
-                expenditure_data.append([row['Tag'], f"{row['Amount']:,.2f}", row['Date']])
+            amounts = filtered_expenditure['Amount'].map(FORMAT_AMOUNT).tolist()
+            expenditure_data = [['Name', 'Amount (₹)', 'Date']] + list(map(list, zip(
+                wrapped_cells(filtered_expenditure['Tag']), amounts, filtered_expenditure['Date'].dt.strftime(DATE_FORMAT).to_numpy()
+            )))
             
-            expenditure_table = Table(expenditure_data)
-            expenditure_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 14),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
+            expenditure_table = LongTable(expenditure_data, colWidths=AMOUNT_COL_WIDTHS, repeatRows=1)
+            expenditure_table.setStyle(TABLE_STYLE)
             story.append(expenditure_table)
             story.append(Spacer(1, 20))
         else:
-            story.append(Paragraph("No expenditure records found for this period.", styles['Normal']))
+            story.append(Paragraph("No expenditure records found for this period.", STYLES['Normal']))
             story.append(Spacer(1, 20))
     
     if report_type in ["Classification", "All"]:
         # Classification section
-        classification_title = Paragraph("Classification Records", styles['Heading2'])
+        classification_title = Paragraph("Classification Records", STYLES['Heading2'])
         story.append(classification_title)
         story.append(Spacer(1, 10))
         
-        df_classification = load_data("Classification")
+        df_classification = get_data("Classification")
         filtered_classification = filter_data_by_date(df_classification, start_date, end_date)
         
         if not filtered_classification.empty:
-            classification_data = [['Name', 'Gender', 'Breed', 'Weight (kg)', 'New Borns', 'Dead Count', 'Vaccination Date']]
-            for _, row in filtered_classification.iterrows():
-                classification_data.append([
-                    row['Name'], row['Gender'], row['Breed'], 
-                    f"{row['Weight']}", f"{row['New Borns']}", 
-                    f"{row['Dead Count']}", row['Vaccination Date']
-                ])
+            header = [Paragraph(h, CLASSIFICATION_HEADER_STYLE) for h in CLASSIFICATION_HEADER]
+            classification_data = [header] + list(map(list, zip(
+                wrapped_cells(filtered_classification['Name']), filtered_classification['Gender'].to_numpy(),
+                wrapped_cells(filtered_classification['Breed']), filtered_classification['Weight'].map(str).to_numpy(),
+                filtered_classification['New Borns'].map(str).to_numpy(),
+                filtered_classification['Dead Count'].map(str).to_numpy(),
+                filtered_classification['Vaccination Date'].to_numpy()
+            )))
             
-            classification_table = Table(classification_data)
-            classification_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
+            # SimpleDocTemplate's frame pads its content by 6pt on each side
+            col_widths = classification_col_widths(doc.width - 12)
+            classification_table = LongTable(classification_data, colWidths=col_widths, repeatRows=1)
+            classification_table.setStyle(CLASSIFICATION_TABLE_STYLE)
             story.append(classification_table)
         else:
-            story.append(Paragraph("No classification records found for this period.", styles['Normal']))
+            story.append(Paragraph("No classification records found for this period.", STYLES['Normal']))
     
     doc.build(story)
     buffer.seek(0)
@@ -198,6 +450,12 @@ def create_pdf_report(report_type, start_date, end_date):
 # ----------- Streamlit UI -----------
 st.title("Farm Dashboard")
 
+# Initialize session state for editing and for changes not yet written to the workbook
+if 'editing' not in st.session_state:
+    st.session_state.editing = {'sheet': None, 'index': None}
+if 'pending' not in st.session_state:
+    st.session_state.pending = {}
+
 # ---------------- Profit/Loss Display -----------------
 profit_loss, total_revenue, total_expenditure = calculate_profit_loss()
 
@@ -212,13 +470,107 @@ with col3:
     else:
         st.markdown(f"<h3 style='color: red;'>Loss: ₹{abs(profit_loss):,.2f} 📉</h3>", unsafe_allow_html=True)
 
+if 'notice' in st.session_state:
+    st.warning(st.session_state.pop('notice'))
+
+if st.session_state.pending:
+    col1, col2, col3 = st.columns([4, 1, 1], vertical_alignment="center")
+    with col1:
+        st.warning(f"Unsaved changes: {', '.join(st.session_state.pending)}")
+    with col2:
+        if st.button("💾 Save", key="save_pending"):
+            skipped = save_pending()
+            if skipped:
+                st.session_state.notice = f"{skipped} change(s) not saved: the record was edited or deleted in another session."
+            st.rerun()
+    with col3:
+        if st.button("↩️ Discard", key="discard_pending"):
+            st.session_state.pending = {}
+            st.rerun()
+
 st.divider()
 
-# Initialize session state for editing
-if 'editing' not in st.session_state:
+
+# ---------------- Edit forms -----------------
+# Fragments, so Cancel only reruns the form; saving reruns the whole app to refresh the tables
+
+def stop_editing():
     st.session_state.editing = {'sheet': None, 'index': None}
 
 
+@st.fragment
+def amount_edit_form(sheet_name, df):
+    """Edit form shared by the Revenue and Expenditure sections"""
+    if st.session_state.editing['sheet'] != sheet_name or st.session_state.editing['index'] is None:
+        return
+    
+    st.subheader(f"Edit {sheet_name} Record")
+    edit_index = st.session_state.editing['index']
+    if edit_index < len(df):
+        current_record = df.iloc[edit_index]
+        
+        with st.form(f"edit_{sheet_name.lower()}_form"):
+            new_tag = st.text_input("Name", value=current_record['Tag'])
+            new_amount = st.number_input("Amount", min_value=0.0, value=float(current_record['Amount']), format="%.2f", step=1.0)
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.form_submit_button("💾 Save Changes"):
+                    edit_record(sheet_name, edit_index, {
+                        "Tag": new_tag, 
+                        "Amount": new_amount, 
+                        "Date": current_record['Date']
+                    })
+                    st.session_state.editing = {'sheet': None, 'index': None}
+                    st.success("Record updated!")
+                    st.rerun()
+            with col2:
+                st.form_submit_button("❌ Cancel", on_click=stop_editing)
+
+
+@st.fragment
+def classification_edit_form(df):
+    """Edit form for the Classification section"""
+    if st.session_state.editing['sheet'] != 'Classification' or st.session_state.editing['index'] is None:
+        return
+    
+    st.subheader("Edit Classification Record")
+    edit_index = st.session_state.editing['index']
+    if edit_index < len(df):
+        current_record = df.iloc[edit_index]
+        
+        with st.form("edit_classification_form"):
+            new_name = st.text_input("Name", value=current_record['Name'])
+            new_gender = st.selectbox("Gender", ["Male", "Female", "Unknown"], 
+                                    index=["Male", "Female", "Unknown"].index(current_record['Gender']))
+            new_breed = st.text_input("Breed", value=current_record['Breed'])
+            new_new_borns = st.number_input("New Borns", min_value=0, step=1, value=int(current_record['New Borns']), format="%d")
+            new_weight = st.number_input("Weight (kg)", min_value=0.0, step=0.1, value=float(current_record['Weight']), format="%.1f")
+            new_dead_count = st.number_input("Dead Count", min_value=0, step=1, value=int(current_record['Dead Count']), format="%d")
+            new_vaccination_date = st.date_input("Vaccination Date", value=pd.to_datetime(current_record['Vaccination Date']).date())
+            new_details = st.text_area("Details", value=current_record['Details'] if pd.notna(current_record['Details']) else "")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.form_submit_button("💾 Save Changes"):
+                    edit_record("Classification", edit_index, {
+                        "Name": new_name,
+                        "Gender": new_gender,
+                        "Breed": new_breed,
+                        "New Borns": new_new_borns,
+                        "Weight": new_weight,
+                        "Dead Count": new_dead_count,
+                        "Vaccination Date": new_vaccination_date.strftime("%Y-%m-%d"),
+                        "Details": new_details,
+                        "Date": current_record['Date']
+                    })
+                    st.session_state.editing = {'sheet': None, 'index': None}
+                    st.success("Record updated!")
+                    st.rerun()
+            with col2:
+                st.form_submit_button("❌ Cancel", on_click=stop_editing)
+
+
 # ---------------- Revenue -----------------
 st.header("💰 Revenue")
 
@@ -228,60 +580,37 @@ with st.form("add_revenue"):
     amount = st.number_input("Amount", min_value=0.0, format="%.2f", step=1.0)
     submitted = st.form_submit_button("➕ Add Revenue")
     if submitted and tag:
-        add_record("Revenue", {"Tag": tag, "Amount": amount, "Date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+        add_record("Revenue", {"Tag": tag, "Amount": amount, "Date": datetime.now().replace(microsecond=0)})
         st.success("Revenue added!")
         st.rerun()
 
 # Display revenue data with edit/delete functionality
-df_revenue = load_data("Revenue")
+df_revenue = get_data("Revenue")
+warn_unreadable_dates("Revenue", df_revenue)
 
 if not df_revenue.empty:
     st.subheader("Revenue Records")
-    for i, row in df_revenue.iterrows():
-        col1, col2, col3, col4, col5 = st.columns([2, 1, 2, 1, 1])
-        
-        with col1:
-            st.write(f"**{row['Tag']}**")
-        with col2:
-            st.write(f"₹{row['Amount']:,.2f}")
-        with col3:
-            st.write(row['Date'])
-        with col4:
-            if st.button("✏️", key=f"edit_revenue_{i}", help="Edit"):
-                st.session_state.editing = {'sheet': 'Revenue', 'index': i}
-                st.rerun()
-        with col5:
-            if st.button("🗑️", key=f"delete_revenue_{i}", help="Delete"):
-                delete_record("Revenue", i)
-                st.success("Record deleted!")
-                st.rerun()
+    st.dataframe(df_revenue, hide_index=True, column_config={
+        RAW_DATE: None,
+        "Tag": "Name",
+        "Amount": st.column_config.NumberColumn("Amount", format="₹%.2f"),
+    })
+    
+    col1, col2, col3 = st.columns([4, 1, 1], vertical_alignment="bottom")
+    with col1:
+        selected = st.selectbox("Select record", df_revenue.index, key="select_revenue",
+                                format_func=lambda i: f"{df_revenue.at[i, 'Tag']} ({df_revenue.at[i, 'Date']})")
+    with col2:
+        if st.button("✏️ Edit", key="edit_revenue"):
+            st.session_state.editing = {'sheet': 'Revenue', 'index': selected}
+    with col3:
+        if st.button("🗑️ Delete", key="delete_revenue"):
+            delete_record("Revenue", selected)
+            st.success("Record deleted!")
+            st.rerun()
 
     # Edit form for revenue
-    if st.session_state.editing['sheet'] == 'Revenue' and st.session_state.editing['index'] is not None:
-        st.subheader("Edit Revenue Record")
-        edit_index = st.session_state.editing['index']
-        if edit_index < len(df_revenue):
-            current_record = df_revenue.iloc[edit_index]
-            
-            with st.form("edit_revenue_form"):
-                new_tag = st.text_input("Name", value=current_record['Tag'])
-                new_amount = st.number_input("Amount", min_value=0.0, value=float(current_record['Amount']), format="%.2f", step=1.0)
-                
-                col1, col2 = st.columns(2)
-                with col1:
-                    if st.form_submit_button("💾 Save Changes"):
-                        edit_record("Revenue", edit_index, {
-                            "Tag": new_tag, 
-                            "Amount": new_amount, 
-                            "Date": current_record['Date']
-                        })
-                        st.session_state.editing = {'sheet': None, 'index': None}
-                        st.success("Record updated!")
-                        st.rerun()
-                with col2:
-                    if st.form_submit_button("❌ Cancel"):
-                        st.session_state.editing = {'sheet': None, 'index': None}
-                        st.rerun()
+    amount_edit_form("Revenue", df_revenue)
 else:
     st.info("No revenue records found.")
 
@@ -295,60 +624,37 @@ with st.form("add_expenditure"):
     amount = st.number_input("Amount", min_value=0.0, format="%.2f", step=1.0)
     submitted = st.form_submit_button("➕ Add Expenditure")
     if submitted and tag:
-        add_record("Expenditure", {"Tag": tag, "Amount": amount, "Date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")})
+        add_record("Expenditure", {"Tag": tag, "Amount": amount, "Date": datetime.now().replace(microsecond=0)})
         st.success("Expenditure added!")
         st.rerun()
 
 # Display expenditure data with edit/delete functionality
-df_expenditure = load_data("Expenditure")
+df_expenditure = get_data("Expenditure")
+warn_unreadable_dates("Expenditure", df_expenditure)
 
 if not df_expenditure.empty:
     st.subheader("Expenditure Records")
-    for i, row in df_expenditure.iterrows():
-        col1, col2, col3, col4, col5 = st.columns([2, 1, 2, 1, 1])
-        
-        with col1:
-            st.write(f"**{row['Tag']}**")
-        with col2:
-            st.write(f"₹{row['Amount']:,.2f}")
-        with col3:
-            st.write(row['Date'])
-        with col4:
-            if st.button("✏️", key=f"edit_expenditure_{i}", help="Edit"):
-                st.session_state.editing = {'sheet': 'Expenditure', 'index': i}
-                st.rerun()
-        with col5:
-            if st.button("🗑️", key=f"delete_expenditure_{i}", help="Delete"):
-                delete_record("Expenditure", i)
-                st.success("Record deleted!")
-                st.rerun()
+    st.dataframe(df_expenditure, hide_index=True, column_config={
+        RAW_DATE: None,
+        "Tag": "Name",
+        "Amount": st.column_config.NumberColumn("Amount", format="₹%.2f"),
+    })
+    
+    col1, col2, col3 = st.columns([4, 1, 1], vertical_alignment="bottom")
+    with col1:
+        selected = st.selectbox("Select record", df_expenditure.index, key="select_expenditure",
+                                format_func=lambda i: f"{df_expenditure.at[i, 'Tag']} ({df_expenditure.at[i, 'Date']})")
+    with col2:
+        if st.button("✏️ Edit", key="edit_expenditure"):
+            st.session_state.editing = {'sheet': 'Expenditure', 'index': selected}
+    with col3:
+        if st.button("🗑️ Delete", key="delete_expenditure"):
+            delete_record("Expenditure", selected)
+            st.success("Record deleted!")
+            st.rerun()
 
     # Edit form for expenditure
-    if st.session_state.editing['sheet'] == 'Expenditure' and st.session_state.editing['index'] is not None:
-        st.subheader("Edit Expenditure Record")
-        edit_index = st.session_state.editing['index']
-        if edit_index < len(df_expenditure):
-            current_record = df_expenditure.iloc[edit_index]
-            
-            with st.form("edit_expenditure_form"):
-                new_tag = st.text_input("Name", value=current_record['Tag'])
-                new_amount = st.number_input("Amount", min_value=0.0, value=float(current_record['Amount']), format="%.2f", step=1.0)
-                
-                col1, col2 = st.columns(2)
-                with col1:
-                    if st.form_submit_button("💾 Save Changes"):
-                        edit_record("Expenditure", edit_index, {
-                            "Tag": new_tag, 
-                            "Amount": new_amount, 
-                            "Date": current_record['Date']
-                        })
-                        st.session_state.editing = {'sheet': None, 'index': None}
-                        st.success("Record updated!")
-                        st.rerun()
-                with col2:
-                    if st.form_submit_button("❌ Cancel"):
-                        st.session_state.editing = {'sheet': None, 'index': None}
-                        st.rerun()
+    amount_edit_form("Expenditure", df_expenditure)
 else:
     st.info("No expenditure records found.")
 
@@ -377,80 +683,39 @@ with st.form("add_classification"):
             "Dead Count": dead_count,
             "Vaccination Date": vaccination_date.strftime("%Y-%m-%d"),
             "Details": details,
-            "Date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            "Date": datetime.now().replace(microsecond=0)
         })
         st.success("Classification added!")
         st.rerun()
 
 # Display classification data with edit/delete functionality
-df_classification = load_data("Classification")
+df_classification = get_data("Classification")
+warn_unreadable_dates("Classification", df_classification)
 
 if not df_classification.empty:
     st.subheader("Classification Records")
-    for i, row in df_classification.iterrows():
-        with st.expander(f"{row['Name']} ({row['Gender']})"):
-            col1, col2 = st.columns(2)
-            with col1:
-                st.write(f"**Breed:** {row['Breed']}")
-                st.write(f"**Weight:** {row['Weight']} kg")
-                st.write(f"**New Borns:** {row['New Borns']}")
-                st.write(f"**Dead Count:** {row['Dead Count']}")
-            with col2:
-                st.write(f"**Vaccination Date:** {row['Vaccination Date']}")
-                st.write(f"**Added On:** {row['Date']}")
-                if row['Details']:
-                    st.write(f"**Details:** {row['Details']}")
-            
-            col3, col4 = st.columns(2)
-            with col3:
-                if st.button("✏️ Edit", key=f"edit_classification_{i}"):
-                    st.session_state.editing = {'sheet': 'Classification', 'index': i}
-                    st.rerun()
-            with col4:
-                if st.button("🗑️ Delete", key=f"delete_classification_{i}"):
-                    delete_record("Classification", i)
-                    st.success("Record deleted!")
-                    st.rerun()
+    st.dataframe(df_classification, hide_index=True, column_order=[
+        "Name", "Gender", "Breed", "Weight", "New Borns", "Dead Count", "Vaccination Date", "Details", "Date"
+    ], column_config={
+        "Weight": st.column_config.NumberColumn("Weight (kg)"),
+        "Date": "Added On",
+    })
+    
+    col1, col2, col3 = st.columns([4, 1, 1], vertical_alignment="bottom")
+    with col1:
+        selected = st.selectbox("Select record", df_classification.index, key="select_classification",
+                                format_func=lambda i: f"{df_classification.at[i, 'Name']} ({df_classification.at[i, 'Gender']})")
+    with col2:
+        if st.button("✏️ Edit", key="edit_classification"):
+            st.session_state.editing = {'sheet': 'Classification', 'index': selected}
+    with col3:
+        if st.button("🗑️ Delete", key="delete_classification"):
+            delete_record("Classification", selected)
+            st.success("Record deleted!")
+            st.rerun()
 
     # Edit form for classification
-    if st.session_state.editing['sheet'] == 'Classification' and st.session_state.editing['index'] is not None:
-        st.subheader("Edit Classification Record")
-        edit_index = st.session_state.editing['index']
-        if edit_index < len(df_classification):
-            current_record = df_classification.iloc[edit_index]
-            
-            with st.form("edit_classification_form"):
-                new_name = st.text_input("Name", value=current_record['Name'])
-                new_gender = st.selectbox("Gender", ["Male", "Female", "Unknown"], 
-                                        index=["Male", "Female", "Unknown"].index(current_record['Gender']))
-                new_breed = st.text_input("Breed", value=current_record['Breed'])
-                new_new_borns = st.number_input("New Borns", min_value=0, step=1, value=int(current_record['New Borns']), format="%d")
-                new_weight = st.number_input("Weight (kg)", min_value=0.0, step=0.1, value=float(current_record['Weight']), format="%.1f")
-                new_dead_count = st.number_input("Dead Count", min_value=0, step=1, value=int(current_record['Dead Count']), format="%d")
-                new_vaccination_date = st.date_input("Vaccination Date", value=pd.to_datetime(current_record['Vaccination Date']).date())
-                new_details = st.text_area("Details", value=current_record['Details'] if pd.notna(current_record['Details']) else "")
-                
-                col1, col2 = st.columns(2)
-                with col1:
-                    if st.form_submit_button("💾 Save Changes"):
-                        edit_record("Classification", edit_index, {
-                            "Name": new_name,
-                            "Gender": new_gender,
-                            "Breed": new_breed,
-                            "New Borns": new_new_borns,
-                            "Weight": new_weight,
-                            "Dead Count": new_dead_count,
-                            "Vaccination Date": new_vaccination_date.strftime("%Y-%m-%d"),
-                            "Details": new_details,
-                            "Date": current_record['Date']
-                        })
-                        st.session_state.editing = {'sheet': None, 'index': None}
-                        st.success("Record updated!")
-                        st.rerun()
-                with col2:
-                    if st.form_submit_button("❌ Cancel"):
-                        st.session_state.editing = {'sheet': None, 'index': None}
-                        st.rerun()
+    classification_edit_form(df_classification)
 else:
     st.info("No classification records found.")
 